@@ -1,31 +1,66 @@
 
-import json, sys
+import io, json, os, sys, tempfile
+from dataclasses import asdict
 from math import isclose
 
+import streaming_decoder
+from streaming_decoder import hex_to_int, split_32byte_chunks, raw_word, decode_uniswap_like, decode_aave_like
+
 # import local sample file
 SAMPLE = "sample_zeru.json"
 
 
-def hex_to_int(h):
-    if not h or h == "0x": return 0
-    return int(h,16)
-
-def int256_from_hexslot(slot_hex):
-    val = int(slot_hex, 16)
-    if val >= 2**255:
-        val = val - 2**256
-    return val
-
 # Basic tests
 def test_hex_to_int():
     assert hex_to_int("0x0") == 0
     assert hex_to_int("0x10") == 16
     assert hex_to_int("0x0000000000000000000000000000000000000005") == 5
+    # odd-length and unprefixed input
+    assert hex_to_int("0x123") == 0x123
+    assert hex_to_int("ff") == 255
+    assert hex_to_int("0x") == 0
+    # uppercase prefix and surrounding whitespace, as int(h, 16) allowed
+    assert hex_to_int("0XFF") == 255
+    assert hex_to_int(" 0x10\n") == 16
+
+def _uniswap_data(tick_word):
+    # amount0, amount1, sqrtPriceX96, liquidity, tick as 32-byte hex words
+    return "0x" + "f"*64 + "0"*62 + "2a" + "0"*63 + "7" + "0"*63 + "9" + tick_word
 
 def test_int256_neg():
     # two's complement: -1 is all ff..ff (256)
-    allf = "f"*64
-    assert int256_from_hexslot(allf) == -1
+    assert decode_uniswap_like(_uniswap_data("f"*64))["tick"] == -1
+    assert decode_uniswap_like(_uniswap_data("8" + "0"*63))["tick"] == -2**255
+    assert decode_uniswap_like(_uniswap_data("7" + "f"*63))["tick"] == 2**255 - 1
+    assert decode_uniswap_like(_uniswap_data("0"*62 + "2a"))["tick"] == 42
+
+def test_decode_uniswap_like():
+    d = decode_uniswap_like(_uniswap_data("f"*63 + "6"))
+    assert d == {"amount0_raw": "0x" + "f"*64, "amount1_raw": "0x2a",
+                 "sqrtPriceX96": "7", "liquidity": "9", "tick": -10}
+    # fewer than five words is not a Uniswap-like payload
+    assert decode_uniswap_like(_uniswap_data("0"*64)[:-64]) is None
+    assert decode_uniswap_like("0x") is None
+    assert decode_uniswap_like(None) is None
+
+def test_split_32byte_chunks():
+    assert split_32byte_chunks("0x") == []
+    slots = split_32byte_chunks("0x" + "ff"*32 + "01")
+    # data is left-padded to a whole number of 32-byte slots
+    assert len(slots) == 2
+    assert int.from_bytes(slots[0], "big") == 0xff
+    assert slots[1] == b"\xff"*31 + b"\x01"
+    assert split_32byte_chunks("0X" + "AB"*32) == [b"\xab"*32]
+
+def test_uppercase_prefix_data():
+    assert decode_aave_like("0X" + "0"*62 + "2A") == {"amount_raw": "0x2a"}
+    assert decode_uniswap_like("0X" + _uniswap_data("f"*64)[2:].upper())["tick"] == -1
+
+def test_raw_word():
+    assert raw_word(b"\x00"*32) == "0x0"
+    assert raw_word(b"\x00"*31 + b"\x2a") == "0x2a"
+    # negative int256 is echoed as its two's-complement word
+    assert raw_word(b"\xff"*32) == "0x" + "f"*64
 
 def test_sample_load_and_transfer_detection():
     data = json.load(open(SAMPLE))
@@ -41,10 +76,152 @@ def test_sample_load_and_transfer_detection():
             break
     assert found, "No Transfer event found in sample"
 
+def _run_main(*args):
+    # Runs the CLI entry point into a temp file; decodedAt is dropped so runs compare equal
+    fd, out = tempfile.mkstemp(suffix=".ndjson")
+    os.close(fd)
+    try:
+        streaming_decoder.main(["streaming_decoder.py", out, *args])
+        with open(out) as f:
+            records = [json.loads(line) for line in f]
+    finally:
+        os.remove(out)
+    for r in records:
+        r.pop("decodedAt")
+    return records
+
+def test_multiple_inputs_keep_order():
+    single = _run_main(SAMPLE)
+    assert len(single) == 43
+    assert _run_main(SAMPLE, SAMPLE) == single + single
+
+def test_failed_input_leaves_no_temp_files():
+    saved = tempfile.tempdir
+    with tempfile.TemporaryDirectory() as scratch:
+        bad = os.path.join(scratch, "bad.json")
+        with open(bad, "w") as f:
+            f.write("{not json")
+        tempfile.tempdir = scratch
+        try:
+            _run_main(bad, SAMPLE, SAMPLE)
+        except ValueError:
+            pass
+        else:
+            assert False, "invalid input was accepted"
+        finally:
+            tempfile.tempdir = saved
+        assert os.listdir(scratch) == ["bad.json"]
+
+def test_known_only():
+    records = _run_main("--known-only", SAMPLE)
+    # the sample has 15 logs from contracts outside KNOWN
+    assert len(records) == 28
+    assert all(r["protocol"] is not None for r in records)
+    assert records == [r for r in _run_main(SAMPLE) if r["protocol"] is not None]
+
+def test_unknown_flag_rejected():
+    try:
+        streaming_decoder.main(["streaming_decoder.py", "--knwon-only", SAMPLE])
+    except SystemExit as e:
+        assert "--knwon-only" in str(e.code)
+    else:
+        assert False, "unknown flag was accepted"
+
+def _decode_sample_records():
+    records = [asdict(e) for e in streaming_decoder.stream_decode_from_file(SAMPLE)]
+    for r in records:
+        r.pop("decodedAt")
+    return records
+
+def test_ijson_stream_matches_one_shot():
+    if streaming_decoder.ijson is None:
+        print("skipped test_ijson_stream_matches_one_shot: ijson not installed")
+        return
+    one_shot = _decode_sample_records()
+    saved = streaming_decoder.STREAM_MIN_BYTES
+    streaming_decoder.STREAM_MIN_BYTES = 0
+    try:
+        assert _decode_sample_records() == one_shot
+    finally:
+        streaming_decoder.STREAM_MIN_BYTES = saved
+
+def test_scan_chain():
+    if streaming_decoder.ijson is None:
+        print("skipped test_scan_chain: ijson not installed")
+        return
+    docs = [
+        {"chain": "ethereum", "logs": []},
+        {"logs": [{"chain": "ignored"}], "chain": {"id": 1, "tags": [1, {"a": None}]}},
+        {"chain": None, "metadata": {"chain": "Ethereum Mainnet"}},
+        {"metadata": {"chain": "Ethereum Mainnet"}},
+        {"metadata": {"nested": {"chain": "ignored"}}},
+        {},
+    ]
+    for doc in docs:
+        expected = doc.get("chain", doc.get("metadata", {}).get("chain", "unknown"))
+        assert streaming_decoder.scan_chain(io.BytesIO(json.dumps(doc).encode())) == expected
+
+USDC = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+AAVE_POOL = "0x87870bca3f3fd6335c3f4ce8392d69350b4fa4e2"
+TRANSFER_SIG = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+def _transfer_log(address):
+    return {
+        "address": address,
+        "topics": [TRANSFER_SIG, "0x" + "0"*24 + "11"*20, "0x" + "0"*24 + "22"*20],
+        "data": "0x" + "0"*56 + "2cb41780",
+    }
+
+def test_dispatch_erc20_transfer():
+    (ev,) = streaming_decoder.decode_logs([_transfer_log("0x" + USDC[2:].upper())], "ethereum")
+    assert ev.contractAddress == USDC
+    assert ev.protocol == "USDC"
+    assert ev.eventType == ev.eventName == "Transfer"
+    assert ev.decoded == {"from": "0x" + "11"*20, "to": "0x" + "22"*20,
+                          "value_raw": "0x2cb41780", "value": 750.0, "decimals": 6}
+    assert ev.humanReadable == "Transfer 750.0 USDC"
+
+def test_rejected_heuristic_does_not_leak_event_type():
+    # an Aave log with empty data is rejected by the heuristic; decoding it first in the
+    # batch used to reuse whatever eventType the previous log left behind
+    logs = [{"address": AAVE_POOL, "topics": ["0x" + "ab"*32], "data": "0x"}, _transfer_log(USDC)]
+    rejected, transfer = streaming_decoder.decode_logs(logs, "ethereum")
+    assert rejected.protocol == "AaveV3:LendingPool"
+    assert rejected.decoded is None and rejected.humanReadable is None
+    assert rejected.eventType is None and rejected.eventName is None
+    assert transfer.eventType == "Transfer"
+    # a known event name is used as the eventType fallback
+    logs = [{"address": AAVE_POOL, "topics": [TRANSFER_SIG], "data": "0x"}]
+    (ev,) = streaming_decoder.decode_logs(logs, "ethereum")
+    assert ev.decoded is None and ev.eventType == ev.eventName == "Transfer"
+
+def test_known_entry_added_after_import():
+    addr = "0x" + "33"*20
+    streaming_decoder.KNOWN[addr] = {"name": "TKN", "type": "token", "decimals": 2}
+    try:
+        (ev,) = streaming_decoder.decode_logs([_transfer_log(addr)], "ethereum")
+    finally:
+        del streaming_decoder.KNOWN[addr]
+    assert ev.eventType == "Transfer"
+    assert isclose(ev.decoded["value"], 0x2cb41780 / 100)
+
 def run_all():
     test_hex_to_int()
     test_int256_neg()
+    test_decode_uniswap_like()
+    test_split_32byte_chunks()
+    test_raw_word()
+    test_uppercase_prefix_data()
     test_sample_load_and_transfer_detection()
+    test_multiple_inputs_keep_order()
+    test_failed_input_leaves_no_temp_files()
+    test_known_only()
+    test_dispatch_erc20_transfer()
+    test_rejected_heuristic_does_not_leak_event_type()
+    test_known_entry_added_after_import()
+    test_ijson_stream_matches_one_shot()
+    test_scan_chain()
+    test_unknown_flag_rejected()
     print("ALL TESTS PASSED")
 
 if __name__ == "__main__":
@@ -1,12 +1,27 @@
 #!/usr/bin/env python3
 """
 Streaming multi-chain event decoder (heuristic).
-Usage: python3 streaming_decoder.py input1.json [input2.json ...]
+Usage: python3 streaming_decoder.py [--known-only] [out.ndjson] input1.json [input2.json ...]
 Writes NDJSON decoded events to stdout or to a file when redirected.
+--known-only drops logs whose contract address is not in KNOWN before decoding.
 This is a self-contained script using simple heuristics for demo purposes.
+Requires Python 3.10+ (slots dataclasses, X | None annotations).
 """
 
-import sys, json, datetime
+import os, sys, json, datetime, shutil, tempfile
+from functools import partial
+from multiprocessing import Pool
+from dataclasses import dataclass
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib parser
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # optional; without it large files are parsed in one go
+    ijson = None
 
 # Basic helpers (same heuristics as used earlier)
 def normalize_addr(addr):
@@ -14,20 +29,26 @@ def normalize_addr(addr):
 
 def hex_to_int(h):
     if not h or h == "0x": return 0
-    return int(h,16)
+    # int(h, 16) accepted surrounding whitespace and a 0X prefix; keep accepting both
+    h = h.strip()
+    d = h[2:] if h[:2] in ("0x", "0X") else h
+    if len(d) % 2: d = "0" + d
+    return int.from_bytes(bytes.fromhex(d), "big")
+
+def data_to_bytes(data_hex):
+    # Left-pads to a whole number of 32-byte words, matching the slot heuristics;
+    # prefix handling matches hex_to_int
+    data_hex = data_hex.strip()
+    d = data_hex[2:] if data_hex[:2] in ("0x", "0X") else data_hex
+    pad = -len(d) % 64
+    if pad:
+        d = "0" * pad + d
+    return bytes.fromhex(d)
 
 def split_32byte_chunks(data_hex):
-    d = data_hex[2:] if data_hex.startswith("0x") else data_hex
-    if d == "": return []
-    if len(d) % 64 != 0:
-        d = d.rjust(((len(d)//64)+1)*64, '0')
-    return [d[i:i+64] for i in range(0, len(d), 64)]
-
-def int256_from_hexslot(slot_hex):
-    val = int(slot_hex, 16)
-    if val >= 2**255:
-        val = val - 2**256
-    return val
+    # Returns 32-byte bytes slots; callers decode them with int.from_bytes
+    b = data_to_bytes(data_hex)
+    return [b[i:i+32] for i in range(0, len(b), 32)]
 
 # Known mapping can be expanded by reading a config file or registry
 KNOWN = {
@@ -38,128 +59,275 @@ KNOWN = {
     "0x87870bca3f3fd6335c3f4ce8392d69350b4fa4e2": {"name":"AaveV3:LendingPool","type":"lending","subtype":"aave_v3"}
 }
 
+def protocol_kind(info):
+    # protocol half of the DISPATCH key: subtype when present, else type
+    return info.get("subtype") or info.get("type")
+
+# 10**decimals lookups; KNOWN token entries also carry their own precomputed scale
+# and kind. Entries added after import have neither and fall back at lookup time.
+POW10 = tuple(10 ** i for i in range(40))
+for _info in KNOWN.values():
+    if _info.get("decimals") is not None:
+        _info["scale"] = POW10[_info["decimals"]]
+    _info["kind"] = protocol_kind(_info)
+
 EVENT_SIG_MAP = {
     "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef":"Transfer",
     "0x8c5be1e5ebec7d5bd14f71427d1e84f3dd0314c0f7b2291e5b200ac8c7c3b925":"Approval"
 }
 
-def decode_erc20_transfer(log, token_info):
-    t = log.get("topics", [])
-    from_addr = "0x" + t[1][-40:] if len(t) > 1 and t[1] else None
-    to_addr = "0x" + t[2][-40:] if len(t) > 2 and t[2] else None
-    value = hex_to_int(log.get("data","0x0"))
+def decode_erc20_transfer(topics, data, token_info):
+    from_addr = "0x" + topics[1][-40:] if len(topics) > 1 and topics[1] else None
+    to_addr = "0x" + topics[2][-40:] if len(topics) > 2 and topics[2] else None
+    value = hex_to_int(data)
     decimals = token_info.get("decimals",18) if token_info else 18
-    human_amount = value / (10 ** decimals) if decimals is not None else value
-    return {"from": from_addr, "to": to_addr, "value_raw": str(value), "value": human_amount, "decimals": decimals}
+    # entries outside KNOWN have no precomputed scale and fall back to 10 ** decimals
+    scale = token_info.get("scale") if token_info else POW10[18]
+    human_amount = value / (scale or 10 ** decimals) if decimals is not None else value
+    return {"from": from_addr, "to": to_addr, "value_raw": hex(value), "value": human_amount, "decimals": decimals}
+
+def raw_word(b):
+    # *_raw fields echo the word as minimal 0x-hex (signed words stay two's complement);
+    # this skips the int -> decimal string conversion
+    return "0x" + (b.hex().lstrip("0") or "0")
 
-def decode_uniswap_like(log):
-    data = log.get("data","0x")
-    slots = split_32byte_chunks(data)
-    if len(slots) < 5:
+def decode_uniswap_like(data):
+    b = data_to_bytes(data or "0x")
+    if len(b) < 160:
         return None
-    amount0 = int256_from_hexslot(slots[0])
-    amount1 = int256_from_hexslot(slots[1])
-    sqrtPriceX96 = int(slots[2],16)
-    liquidity = int(slots[3],16)
-    tick = int256_from_hexslot(slots[4])
-    return {"amount0_raw":str(amount0),"amount1_raw":str(amount1),"sqrtPriceX96":str(sqrtPriceX96),"liquidity":str(liquidity),"tick":tick}
-
-def decode_aave_like(log):
-    data = log.get("data","0x")
-    slots = split_32byte_chunks(data)
+    sqrtPriceX96 = int.from_bytes(b[64:96], "big")
+    liquidity = int.from_bytes(b[96:128], "big")
+    tick = int.from_bytes(b[128:160], "big", signed=True)
+    return {"amount0_raw":raw_word(b[0:32]),"amount1_raw":raw_word(b[32:64]),"sqrtPriceX96":str(sqrtPriceX96),"liquidity":str(liquidity),"tick":tick}
+
+def decode_aave_like(data):
+    slots = split_32byte_chunks(data or "0x")
     if not slots: return None
-    return {"amount_raw": str(int(slots[0],16))}
+    return {"amount_raw": raw_word(slots[0])}
+
+# Event handlers: (topics, data, proto) -> (decoded, humanReadable, eventType).
+# Heuristic decoders that do not match return Nones; eventType then falls back to the event name.
+def _decode_token_transfer(topics, data, proto):
+    decoded = decode_erc20_transfer(topics, data, proto)
+    return decoded, f"Transfer {decoded['value']} {proto['name']}", "Transfer"
+
+def _decode_token_approval(topics, data, proto):
+    decoded = decode_erc20_transfer(topics, data, proto)
+    return decoded, f"Approval {decoded['value']} {proto['name']}", "Approval"
+
+def _decode_uniswap_sub(topics, data, proto):
+    decoded = decode_uniswap_like(data)
+    if not decoded:
+        return None, None, None
+    return decoded, "Uniswap-like swap/mint/burn (raw values)", "Uniswap:SwapLike"
+
+def _decode_aave_sub(topics, data, proto):
+    decoded = decode_aave_like(data)
+    if not decoded:
+        return None, None, None
+    return decoded, "Aave-like event (raw amount)", "Aave:Event"
+
+def _decode_generic(topics, data, proto):
+    data_int = hex_to_int(data)
+    # 32-byte topics collapse to their address tail; only that slice is lowercased
+    topics_parsed = [
+        None if not t else ("0x"+t[-40:].lower() if len(t)>=66 and t[:2] in ("0x","0X") else t.lower())
+        for t in topics
+    ]
+    return {"topics":topics_parsed,"data_int":str(data_int)}, "Generic event (topics+data)", "Generic"
+
+# Keyed on (event name, protocol kind); a None event name matches any event for that kind
+DISPATCH = {
+    ("Transfer", "token"): _decode_token_transfer,
+    ("Approval", "token"): _decode_token_approval,
+    (None, "uniswap_v3"): _decode_uniswap_sub,
+    (None, "aave_v3"): _decode_aave_sub,
+}
+
+# Output record; field order is the NDJSON key order. orjson serializes it directly.
+@dataclass(slots=True)
+class DecodedEvent:
+    decodedAt: datetime.datetime
+    chain: str | None
+    transactionHash: str | None
+    blockNumber: int | None
+    logIndex: int | None
+    contractAddress: str | None
+    protocol: str | None
+    protocolType: str | None
+    eventType: str | None
+    eventName: str | None
+    decoded: dict | None
+    humanReadable: str | None
+    raw: dict
+
+DECODED_AT_REFRESH = 1000
+# Inputs larger than this are parsed incrementally with ijson (when installed) so
+# memory stays bounded. With a C backend that costs no measurable time, so only tiny
+# files take the one-shot parse; the pure-Python backend is several times slower and
+# is kept for inputs large enough that a one-shot parse would balloon RSS.
+_IJSON_C_BACKEND = bool(ijson) and ijson.backend.startswith("yajl2_c")
+STREAM_MIN_BYTES = (1 if _IJSON_C_BACKEND else 64) * 1024 * 1024
+
+_SCALAR_EVENTS = ("string", "number", "boolean", "null")
+
+def _build_value(events, event, value):
+    # Assemble the JSON value starting at (event, value) from the remaining parser events
+    if event in _SCALAR_EVENTS:
+        return value
+    builder = ijson.ObjectBuilder()
+    builder.event(event, value)
+    depth = 1
+    for _, event, value in events:
+        builder.event(event, value)
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+            if depth == 0:
+                break
+    return builder.value
+
+def scan_chain(f):
+    # Walk parser events for "chain" / "metadata.chain" without building the logs array;
+    # same precedence as payload.get("chain", payload["metadata"].get("chain", "unknown"))
+    meta_chain = "unknown"
+    events = ijson.parse(f, use_float=True)
+    for prefix, event, value in events:
+        if event == "map_key" or event.startswith("end_"):
+            continue
+        if prefix == "chain":
+            return _build_value(events, event, value)
+        if prefix == "metadata.chain":
+            meta_chain = _build_value(events, event, value)
+    return meta_chain
 
 # Streaming generator: yields decoded events one by one
-def stream_decode_from_file(path):
-    with open(path,"r") as f:
-        payload = json.load(f)
-    chain = payload.get("chain", payload.get("metadata", {}).get("chain", "unknown"))
-    logs = payload.get("logs", [])
-    for log in logs:
-        addr = normalize_addr(log.get("address",""))
-        proto = KNOWN.get(addr)
-        topic0 = None
-        if log.get("topics") and len(log["topics"])>0 and log["topics"][0]:
-            topic0 = log["topics"][0].lower()
-        event_name = EVENT_SIG_MAP.get(topic0, None)
-        decoded = None
-        human = None
-        if event_name == "Transfer" and proto and proto.get("type")=="token":
-            decoded = decode_erc20_transfer(log, proto)
-            human = f"Transfer {decoded['value']} {proto['name']}"
-            event_type = "Transfer"
-        elif event_name == "Approval" and proto and proto.get("type")=="token":
-            decoded = decode_erc20_transfer(log, proto)
-            human = f"Approval {decoded['value']} {proto['name']}"
-            event_type = "Approval"
-        elif proto and proto.get("subtype")=="uniswap_v3":
-            enriched = decode_uniswap_like(log)
-            if enriched:
-                decoded = enriched
-                human = "Uniswap-like swap/mint/burn (raw values)"
-                event_type = "Uniswap:SwapLike"
-        elif proto and proto.get("subtype")=="aave_v3":
-            enriched = decode_aave_like(log)
-            if enriched:
-                decoded = enriched
-                human = "Aave-like event (raw amount)"
-                event_type = "Aave:Event"
+def stream_decode_from_file(path, known_only=False):
+    with open(path,"rb") as f:
+        if ijson and os.path.getsize(path) > STREAM_MIN_BYTES:
+            chain = scan_chain(f)
+            f.seek(0)
+            logs = ijson.items(f, "logs.item", use_float=True)
         else:
-            # generic
-            data_int = hex_to_int(log.get("data","0x0"))
-            topics_parsed = []
-            for t in log.get("topics",[]):
-                if not t:
-                    topics_parsed.append(None)
-                else:
-                    tv = t.lower()
-                    if tv.startswith("0x") and len(tv)>=66:
-                        topics_parsed.append("0x"+tv[-40:])
-                    else:
-                        topics_parsed.append(tv)
-            decoded = {"topics":topics_parsed,"data_int":str(data_int)}
-            human = "Generic event (topics+data)"
-            event_type = "Generic"
-        out = {
-            "decodedAt": datetime.datetime.utcnow().isoformat()+"Z",
-            "chain": chain,
-            "transactionHash": log.get("transactionHash"),
-            "blockNumber": log.get("blockNumber"),
-            "logIndex": log.get("logIndex"),
-            "contractAddress": addr,
-            "protocol": proto.get("name") if proto else None,
-            "protocolType": proto.get("type") if proto else None,
-            "eventType": event_type,
-            "eventName": event_name or event_type,
-            "decoded": decoded,
-            "humanReadable": human,
-            "raw": {"topics": log.get("topics"), "data": log.get("data")}
-        }
-        yield out
+            # Read as bytes so orjson can parse without an intermediate str decode
+            payload = orjson.loads(f.read()) if orjson else json.load(f)
+            chain = payload.get("chain", payload.get("metadata", {}).get("chain", "unknown"))
+            logs = payload.get("logs", [])
+        yield from decode_logs(logs, chain, known_only)
+
+def decode_logs(logs, chain, known_only=False):
+    decoded_at = None
+    known_get = KNOWN.get
+    sig_get = EVENT_SIG_MAP.get
+    dispatch_get = DISPATCH.get
+    for i, log in enumerate(logs):
+        # one timestamp per batch of logs; refreshed so long files keep sub-second resolution
+        if i % DECODED_AT_REFRESH == 0:
+            decoded_at = datetime.datetime.utcnow()
+        # KNOWN keys are lowercase; only pay for .lower() when the raw address misses
+        addr = log.get("address","")
+        proto = known_get(addr)
+        if proto is None:
+            addr = normalize_addr(addr)
+            proto = known_get(addr)
+        if known_only and proto is None:
+            continue
+        raw_topics = log.get("topics")
+        data = log.get("data")
+        topics = raw_topics or ()
+        topic0 = topics[0].lower() if topics and topics[0] else None
+        event_name = sig_get(topic0)
+        if proto is None:
+            handler = _decode_generic
+        else:
+            kind = proto.get("kind") or protocol_kind(proto)
+            handler = dispatch_get((event_name, kind)) or dispatch_get((None, kind), _decode_generic)
+        decoded, human, event_type = handler(topics, data, proto)
+        yield DecodedEvent(
+            decoded_at,
+            chain,
+            log.get("transactionHash"),
+            log.get("blockNumber"),
+            log.get("logIndex"),
+            addr,
+            proto.get("name") if proto else None,
+            proto.get("type") if proto else None,
+            event_type or event_name,
+            event_name or event_type,
+            decoded,
+            human,
+            {"topics": raw_topics, "data": data},
+        )
+
+# decodedAt is a naive UTC datetime; orjson renders it as ISO-8601 with a "Z" suffix
+ORJSON_OPTS = (orjson.OPT_APPEND_NEWLINE | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z) if orjson else 0
+FLUSH_BYTES = 1 << 16
+
+def _json_default(obj):
+    if isinstance(obj, DecodedEvent):
+        # shallow: json walks the nested decoded/raw dicts itself, so asdict's deep copy is wasted
+        return {f: getattr(obj, f) for f in DecodedEvent.__slots__}
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat() + "Z"
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_ndjson(obj):
+    """Serialize one decoded event as a newline-terminated NDJSON line (bytes)."""
+    if orjson:
+        return orjson.dumps(obj, option=ORJSON_OPTS)
+    return (json.dumps(obj, default=_json_default) + "\n").encode()
+
+def write_ndjson(events, writer):
+    # Batch lines into ~64KB writes instead of one write per record
+    buf = bytearray()
+    for decoded in events:
+        buf += dumps_ndjson(decoded)
+        if len(buf) > FLUSH_BYTES:
+            writer.write(buf)
+            buf.clear()
+    writer.write(buf)
+
+def decode_file_to_tempfile(path, tmpdir, known_only=False):
+    """Decode one input file into an NDJSON file under tmpdir and return its path (pool worker entry point)."""
+    fd, tmp = tempfile.mkstemp(suffix=".ndjson", dir=tmpdir)
+    with os.fdopen(fd, "wb") as out:
+        write_ndjson(stream_decode_from_file(path, known_only), out)
+    return tmp
 
 def main(args):
+    flags = [a for a in args[1:] if a.startswith("--")]
+    for flag in flags:
+        if flag != "--known-only":
+            sys.exit(f"streaming_decoder.py: unknown option {flag}")
+    known_only = "--known-only" in flags
+    args = [args[0]] + [a for a in args[1:] if not a.startswith("--")]
     out_file = None
     if len(args) >= 2:
         out_file = args[1]
     input_files = args[2:] if len(args) > 2 else ["sample_zeru.json"]
     # If out_file provided, write NDJSON to it
-    writer = None
+    writer = open(out_file, "wb") if out_file else sys.stdout.buffer
+    if len(input_files) > 1:
+        # Files are independent: each worker decodes into its own temp file and only the
+        # path comes back; imap keeps input order while we copy them into writer.
+        # The directory belongs to this process, so a failed or terminated worker
+        # cannot leave files behind; the pool is shut down before it is removed.
+        with tempfile.TemporaryDirectory() as tmpdir, Pool(min(os.cpu_count() or 1, len(input_files))) as pool:
+            worker = partial(decode_file_to_tempfile, tmpdir=tmpdir, known_only=known_only)
+            for tmp in pool.imap(worker, input_files):
+                with open(tmp, "rb") as f:
+                    shutil.copyfileobj(f, writer, FLUSH_BYTES)
+                os.remove(tmp)
+    else:
+        write_ndjson(stream_decode_from_file(input_files[0], known_only), writer)
     if out_file:
-        writer = open(out_file, "w")
-    for inp in input_files:
-        for decoded in stream_decode_from_file(inp):
-            line = json.dumps(decoded)
-            if writer:
-                writer.write(line + "\n")
-            else:
-                print(line)
+        writer.close()
 
 if __name__ == "__main__":
     # default behavior: write to streamed_decoded.ndjson in same dir
-    import os, sys
     args = sys.argv
-    if len(args) == 1:
-        # invoked without args; default to sample file and default out
-        args = [args[0], "streamed_decoded.ndjson", "sample_zeru.json"]
+    if not [a for a in args[1:] if not a.startswith("--")]:
+        # invoked without positional args; default to sample file and default out
+        args = [args[0], "streamed_decoded.ndjson", "sample_zeru.json"] + args[1:]
     main(args)